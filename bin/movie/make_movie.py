@@ -1,19 +1,46 @@
+import functools
+import hashlib
 import json
 import os
+import shutil
+import subprocess
 import sys
-from moviepy import (
-    ImageClip,
-    AudioFileClip,
-    TextClip,
-    CompositeVideoClip,
-    ColorClip,
-    concatenate_videoclips,
-)
-
-# ==========================================
-# 1. 環境設定
-# ==========================================
-os.environ["IMAGEMAGICK_BINARY"] = r"C:\Program Files\ImageMagick-7.1.2-Q16-HDRI\magick.exe"
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, repeat
+from operator import itemgetter
+from types import MappingProxyType
+from PIL import Image, ImageDraw, ImageFont
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 字幕PNGのディスクキャッシュ（描画方法を変えたらバージョンを上げる）
+TEXT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'text')
+TEXT_CACHE_VERSION = 1
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def load_json_file(json_path):
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+@functools.lru_cache(maxsize=8)
+def _read_styles(styles_path, mtime):
+    # mtimeをキーに含めることで、ファイルが更新された場合だけ読み直す
+    return load_json_file(styles_path)
+
 
 def load_styles(styles_path):
     if not styles_path:
@@ -22,8 +49,7 @@ def load_styles(styles_path):
     if not os.path.exists(styles_path):
         print(f"Error: スタイルJSONファイル '{styles_path}' が見つかりません。")
         return None
-    with open(styles_path, 'r', encoding='utf-8') as f:
-        styles = json.load(f)
+    styles = _read_styles(styles_path, os.path.getmtime(styles_path))
     if not isinstance(styles, dict) or not styles:
         print("Error: スタイルJSONの形式が不正です。")
         return None
@@ -38,6 +64,66 @@ def resolve_path(file_path, base_dir):
     return os.path.join(base_dir, file_path)
 
 
+def scan_dir_names(base_dir):
+    """
+    ベースディレクトリ直下のファイル名を1回のscandirでまとめて取得する関数
+    """
+    if not base_dir or not os.path.isdir(base_dir):
+        return None
+    with os.scandir(base_dir) as entries:
+        return frozenset(os.path.normcase(entry.name) for entry in entries if entry.is_file())
+
+
+def file_exists(file_path, base_dir, dir_listings):
+    """
+    ベースディレクトリ直下の相対パスは事前取得したファイル名一覧で判定し、
+    それ以外（絶対パス・サブディレクトリ）はos.path.existsにフォールバックする関数
+    """
+    if not file_path:
+        return False
+    names = dir_listings.get(base_dir) if base_dir else None
+    if names is not None and not os.path.isabs(file_path) and os.path.basename(file_path) == file_path:
+        return os.path.normcase(file_path) in names
+    return os.path.exists(resolve_path(file_path, base_dir))
+
+
+def _merge_scan(lengths, threshold, groups):
+    """
+    各行の文字数から、結合後に何行目へまとまるかをgroupsへ書き込む関数
+    numbaが利用できる場合はJITコンパイルして使う
+    """
+    group = 0
+    buffer_length = lengths[0]
+    groups[0] = 0
+    for i in range(1, len(lengths)):
+        # 現在のバッファと次の行を足して閾値以下なら結合
+        if buffer_length + lengths[i] <= threshold:
+            buffer_length += lengths[i]
+        else:
+            group += 1
+            buffer_length = lengths[i]
+        groups[i] = group
+    return group + 1
+
+
+if njit is not None:
+    _merge_scan = njit(cache=True)(_merge_scan)
+    # 計測対象の処理中にコンパイルが走らないよう、import時に1回呼んでおく
+    _merge_scan(np.zeros(1, dtype=np.int64), 0, np.zeros(1, dtype=np.int64))
+
+
+def _merge_groups(lines, threshold):
+    if njit is None:
+        lengths = [len(line) for line in lines]
+        groups = [0] * len(lines)
+    else:
+        lengths = np.fromiter(map(len, lines), dtype=np.int64, count=len(lines))
+        groups = np.empty(len(lines), dtype=np.int64)
+    _merge_scan(lengths, threshold, groups)
+    return groups
+
+
+@functools.lru_cache(maxsize=256)
 def merge_short_lines(text, threshold=10):
     """
     行ごとの文字数が短い場合、次の行と足しても指定文字数(threshold)以下なら
@@ -51,31 +137,40 @@ def merge_short_lines(text, threshold=10):
     if len(lines) <= 1:
         return text
 
-    merged = []
-    buffer = lines[0]
+    groups = _merge_groups(lines, threshold)
+    merged = (
+        ''.join(line for _, line in grouped)
+        for _, grouped in groupby(zip(groups, lines), key=itemgetter(0))
+    )
+    return '\n'.join(merged)
 
-    for i in range(1, len(lines)):
-        next_line = lines[i]
-        # 現在のバッファと次の行を足して閾値以下なら結合
-        if len(buffer) + len(next_line) <= threshold:
-            buffer += next_line
-        else:
-            merged.append(buffer)
-            buffer = next_line
 
-    merged.append(buffer)
-    return '\n'.join(merged)
+@functools.lru_cache(maxsize=32)
+def load_font(font_path, font_size):
+    return ImageFont.truetype(font_path, font_size)
 
 
-def calculate_optimized_fontsize(text, base_fontsize, target_width):
+@functools.lru_cache(maxsize=256)
+def calculate_optimized_fontsize(text, base_fontsize, target_width, font_path=None):
     """
     テキストがターゲット幅に収まるようにフォントサイズを調整する関数
+    font_pathを指定した場合は実際のフォントで行幅を計測する
     """
     if not text:
         return base_fontsize
 
-    lines = text.split('\n')
-    max_char_count = max(len(line) for line in lines) if lines else 0
+    lines = text.splitlines() or [text]
+
+    if font_path:
+        # 行幅はフォントサイズに比例するため、基準サイズで1回計測して縮尺を求める
+        font = load_font(font_path, base_fontsize)
+        max_line_width = max(map(font.getlength, lines), default=0)
+        if max_line_width == 0:
+            return base_fontsize
+        calculated_size = int(base_fontsize * target_width / max_line_width * 0.95)
+        return min(base_fontsize, calculated_size)
+
+    max_char_count = max(map(len, lines), default=0)
 
     if max_char_count == 0:
         return base_fontsize
@@ -86,7 +181,17 @@ def calculate_optimized_fontsize(text, base_fontsize, target_width):
     return min(base_fontsize, calculated_size)
 
 
+_NAMED_COLORS = MappingProxyType({
+    "white": (255, 255, 255),
+    "black": (0, 0, 0),
+})
+
+
+@functools.lru_cache(maxsize=32)
 def normalize_background_color(color_value):
+    """
+    背景色の指定をRGBタプルに正規化する関数（キャッシュのため、リストはタプルにして渡す）
+    """
     if color_value is None:
         return None
     if isinstance(color_value, (list, tuple)) and len(color_value) == 3:
@@ -95,225 +200,527 @@ def normalize_background_color(color_value):
         color_value = color_value.strip()
         if color_value.startswith("#") and len(color_value) == 7:
             return tuple(int(color_value[i:i + 2], 16) for i in (1, 3, 5))
-        named_colors = {
-            "white": (255, 255, 255),
-            "black": (0, 0, 0),
-        }
-        mapped = named_colors.get(color_value.lower())
+        mapped = _NAMED_COLORS.get(color_value.lower())
         if mapped:
             return mapped
     return color_value
 
 
-def build_text_clip(text, style, font_size, width, start_time, duration, position,
-                    stroke_color=None, stroke_width=None):
-    return TextClip(
-        text=text,
-        font=style['font'],
-        font_size=font_size,
-        color=style['color'],
-        bg_color=style.get('bg_color'),
-        stroke_color=stroke_color if stroke_color is not None else style.get('stroke_color'),
-        stroke_width=stroke_width if stroke_width is not None else style.get('stroke_width', 0),
-        method='caption',
-        size=(width, None)
-    ).with_start(start_time).with_duration(duration).with_position(position)
+def overlay_position(position):
+    """
+    MoviePyのwith_position相当の指定をffmpegのoverlay座標式に変換する関数
+    """
+    x, y = position
+    x_expr = {'center': '(W-w)/2', 'left': '0', 'right': 'W-w'}.get(x, x)
+    y_expr = {'center': '(H-h)/2', 'top': '0', 'bottom': 'H-h'}.get(y, y)
+    return str(x_expr), str(y_expr)
 
 
-def create_video_from_json(json_path, image_base_dir=None, audio_base_dir=None, bgm_base_dir=None,
-                           output_base_dir=None, styles_path=None, thumbnail_path=None):
-    if not os.path.exists(json_path):
-        print(f"Error: JSON file '{json_path}' not found.")
-        return
+def wrap_caption_lines(text, font, max_width):
+    """
+    TextClipのcaption相当: 各行が指定幅に収まるよう文字単位で折り返す関数
+    """
+    wrapped = []
+    for line in text.split('\n'):
+        current = ''
+        for char in line:
+            if current and font.getlength(current + char) > max_width:
+                wrapped.append(current)
+                current = char
+            else:
+                current += char
+        wrapped.append(current)
+    return wrapped
 
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
 
-    styles = load_styles(styles_path)
-    if not styles:
-        return
+def _hashable(value):
+    return tuple(value) if isinstance(value, list) else value
 
-    settings = data['project_settings']
-    scene_clips = []
 
-    print("--- シーンの生成開始 ---")
-    for i, s in enumerate(data['scenes']):
-        print(f"Scene {i + 1}/{len(data['scenes'])} を処理中...")
+def _draw_text_image(text, font_path, font_size, color, bg_color, stroke_color, stroke_width,
+                     outer_stroke_color, outer_stroke_width, width):
+    """
+    字幕をPillowで描画したRGBA画像を返す関数
+    """
+    font = load_font(font_path, font_size)
+
+    layers = []
+    if outer_stroke_width:
+        layers.append((outer_stroke_color, outer_stroke_width))
+    layers.append((stroke_color, stroke_width))
+    stroke_margin = max(layer_width for _, layer_width in layers)
+
+    caption = '\n'.join(wrap_caption_lines(text, font, width - stroke_margin * 2))
+    anchor_x = width / 2
+    measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+    _, top, _, bottom = measure.multiline_textbbox(
+        (anchor_x, 0), caption, font=font, anchor='ma', align='center', stroke_width=stroke_margin
+    )
 
-        audio_path = resolve_path(s['narration']['audio_path'], audio_base_dir)
-        if not os.path.exists(audio_path):
-            print(f"Warning: Audio '{audio_path}' not found. Skipping scene.")
-            continue
+    # 縁取りを含めた実寸に余白を足しただけのキャンバスを確保する（見切れ対策の空行は不要）
+    padding = 2
+    image = Image.new('RGBA', (width, bottom - top + padding * 2), bg_color or (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for layer_color, layer_width in layers:
+        draw.multiline_text(
+            (anchor_x, padding - top),
+            caption,
+            font=font,
+            fill=color,
+            anchor='ma',
+            align='center',
+            stroke_width=layer_width,
+            stroke_fill=layer_color
+        )
+    return image
+
+
+@functools.lru_cache(maxsize=512)
+def cached_text_png(*render_args):
+    """
+    描画引数のハッシュをファイル名にして字幕PNGをディスクにキャッシュし、そのパスを返す関数
+    再実行時も同じ文言・スタイルの字幕は描画せずに再利用する
+    """
+    key = repr((TEXT_CACHE_VERSION, render_args)).encode('utf-8')
+    digest = hashlib.blake2b(key, digest_size=16).hexdigest()
+    path = os.path.join(TEXT_CACHE_DIR, f"{digest}.png")
+    if os.path.exists(path):
+        return path
+
+    image = _draw_text_image(*render_args)
+    os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+    # 並列に描画しているシーン同士で書きかけのファイルを読まないよう、書き込み後に差し替える
+    fd, temp_path = tempfile.mkstemp(dir=TEXT_CACHE_DIR, suffix='.png.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        image.save(f, format='PNG')
+    try:
+        os.replace(temp_path, path)
+    except (PermissionError, FileExistsError):
+        # 同じ字幕を別のシーンが先に書き出し、そのffmpegが開いている場合(Windows)は既存の方を使う
+        os.remove(temp_path)
+        if not os.path.exists(path):
+            raise
+    return path
+
+
+def render_text_image(text, style, font_size, width):
+    """
+    字幕の透過PNGを用意し、そのパスを返す関数
+    外側の縁取りが有効な場合は同じ画像に重ねて描画する
+    """
+    base_stroke_width = style.get('stroke_width', 0)
+    stroke_color = _hashable(style.get('stroke_color'))
+
+    outer_stroke_width = 0
+    outer_stroke_extra_width = style.get('outer_stroke_extra_width', 1)
+    if style.get('outer_stroke_enabled', False) and outer_stroke_extra_width > 0:
+        outer_stroke_width = base_stroke_width + outer_stroke_extra_width
+
+    return cached_text_png(
+        text,
+        style['font'],
+        font_size,
+        _hashable(style['color']),
+        _hashable(style.get('bg_color')),
+        stroke_color,
+        base_stroke_width if stroke_color is not None else 0,
+        _hashable(style.get('outer_stroke_color', 'black')),
+        outer_stroke_width,
+        width
+    )
+
+
+def build_background(canvas_size, background_color):
+    fill = background_color if isinstance(background_color, tuple) else (0, 0, 0)
+    return Image.new('RGB', canvas_size, fill)
+
+
+def render_scene_frame(img_path, background, output_path):
+    """
+    背景と画像（横幅フィット・中央配置）を合成したシーンの土台フレームを作成する関数
+    backgroundは全シーンで共有するため、コピーに対して描画する
+    """
+    canvas_size = background.size
+    with Image.open(img_path) as img:
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+        img = img.convert('RGBA' if has_alpha else 'RGB')
+        new_height = round(canvas_size[0] * img.height / img.width)
+        img = img.resize((canvas_size[0], new_height), Image.Resampling.LANCZOS)
+    img_y = (canvas_size[1] - new_height) // 2
+
+    if new_height >= canvas_size[1] and not has_alpha:
+        # 不透明な画像がキャンバス全体を覆う場合、背景は見えないので合成しない
+        canvas = img.crop((0, -img_y, canvas_size[0], canvas_size[1] - img_y))
+    else:
+        canvas = background.copy()
+        canvas.paste(img, (0, img_y), img if has_alpha else None)
+    canvas.save(output_path)
+
+
+def probe_duration(path):
+    """
+    ffprobeでメディアの長さ（秒）だけを読み取る関数
+    """
+    return float(subprocess.check_output(
+        ['ffprobe', '-v', 'quiet', '-show_entries', 'format=duration', '-of', 'csv=p=0', path]
+    ))
 
-        audio = AudioFileClip(audio_path)
-        duration = audio.duration  # シーン全体の長さ（音声の長さ）
 
-        img_path = resolve_path(s['image_path'], image_base_dir)
-        if not os.path.exists(img_path):
-            print(f"Warning: Image '{img_path}' not found. Skipping.")
+def remove_work_files(paths):
+    """
+    エンコード済みの中間ファイルを削除し、作業ディレクトリの使用量をシーン数に依存させない
+    """
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def run_ffmpeg(command):
+    try:
+        subprocess.run(command, check=True)
+    except FileNotFoundError:
+        print("Error: ffmpeg が見つかりません。PATHを確認してください。")
+        return False
+    except subprocess.CalledProcessError as e:
+        print(f"Error: ffmpeg の実行に失敗しました (終了コード: {e.returncode})。")
+        return False
+    return True
+
+
+# ハードウェアエンコーダの優先順位と、それぞれに付与するffmpegパラメータ
+H264_ENCODER_PARAMS = {
+    'h264_nvenc': ['-preset', 'p4', '-rc', 'vbr', '-cq', '23'],
+    'h264_qsv': [],
+    'h264_videotoolbox': [],
+    'libx264': ['-preset', 'ultrafast'],
+}
+
+# コンシューマ向けGPUは同時エンコードのセッション数が少ないため、HWエンコーダ使用時の並列数の上限
+HW_ENCODER_MAX_WORKERS = 2
+
+
+@functools.lru_cache(maxsize=None)
+def pick_h264_encoder():
+    """
+    利用可能なH.264エンコーダを1回だけ調べて返す関数
+    一覧に載っていてもGPUが無いと失敗するため、本番と同じパラメータで短いテストエンコードをして確認する
+    """
+    try:
+        encoders = subprocess.check_output(
+            ['ffmpeg', '-hide_banner', '-encoders'], stderr=subprocess.DEVNULL, text=True
+        )
+    except (FileNotFoundError, subprocess.CalledProcessError):
+        return 'libx264'
+
+    for encoder in ('h264_nvenc', 'h264_qsv', 'h264_videotoolbox'):
+        if encoder not in encoders:
             continue
+        probe = subprocess.run(
+            [
+                'ffmpeg', '-hide_banner', '-loglevel', 'error',
+                '-f', 'lavfi', '-i', 'color=s=256x256:d=0.1',
+                '-c:v', encoder, *H264_ENCODER_PARAMS[encoder], '-pix_fmt', 'yuv420p',
+                '-f', 'null', '-'
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if probe.returncode == 0:
+            return encoder
+    return 'libx264'
+
 
-        img = ImageClip(img_path).with_duration(duration)
-        img = img.resized(width=settings['width'])
+def segment_output_args(fps):
+    """
+    concat demuxerでストリームコピー結合できるよう、全セグメントで共通のエンコード設定
+    """
+    encoder = pick_h264_encoder()
+    return [
+        '-r', str(fps),
+        '-c:v', encoder,
+        *H264_ENCODER_PARAMS[encoder],
+        '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-ar', '44100',
+        '-ac', '2',
+    ]
+
+
+def build_layout(settings):
+    """
+    呼び出し中に変化しない描画設定をまとめて1回だけ計算する関数
+    """
+    canvas_size = (settings['width'], settings['height'])
+    background_color = normalize_background_color(_hashable(settings.get('background_color', 'white')))
+    return {
+        'canvas_size': canvas_size,
+        'target_width': int(canvas_size[0] * 0.9),
+        'background_color': background_color,
+        'background': build_background(canvas_size, background_color),
+        'fps': settings.get('fps', 30),
+    }
+
+
+def render_scene(scene, layout, styles, base_dirs, dir_listings, out_path):
+    """
+    1シーンを単独のmp4セグメントとして書き出す関数
+    音声・画像が無くスキップした場合はNoneを返し、エンコードに失敗した場合はRuntimeErrorを送出する
+    """
+    image_base_dir, audio_base_dir = base_dirs
+    canvas_size = layout['canvas_size']
+    target_width = layout['target_width']
+    fps = layout['fps']
+    work_prefix = os.path.splitext(out_path)[0]
+
+    audio_path = resolve_path(scene['narration']['audio_path'], audio_base_dir)
+    if not file_exists(scene['narration']['audio_path'], audio_base_dir, dir_listings):
+        print(f"Warning: Audio '{audio_path}' not found. Skipping scene.")
+        return None
 
-        if s.get('animation') == 'zoom_in':
-            img = img.resized(lambda t: 1.0 + 0.1 * (t / duration))
+    try:
+        duration = probe_duration(audio_path)  # シーン全体の長さ（音声の長さ）
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print(f"Warning: Audio '{audio_path}' の長さを取得できません ({e})。Skipping scene.")
+        return None
 
-        img = img.with_position('center')
+    img_path = resolve_path(scene['image_path'], image_base_dir)
+    if not file_exists(scene['image_path'], image_base_dir, dir_listings):
+        print(f"Warning: Image '{img_path}' not found. Skipping.")
+        return None
 
-        background_color = normalize_background_color(
-            settings.get('background_color', 'white')
+    frame_path = f"{work_prefix}_frame.png"
+    render_scene_frame(img_path, layout['background'], frame_path)
+
+    work_files = [frame_path]
+
+    # ffmpegへ渡す入力引数とfilter_complexのノード
+    # 土台フレームは1枚だけデコードし、フィルタ内で必要なフレーム数に展開する
+    inputs = [
+        ['-framerate', str(fps), '-i', frame_path],
+        ['-i', audio_path],
+    ]
+    filters = []
+
+    video_label = "base"
+    total_frames = max(1, round(duration * fps))
+    if scene.get('animation') == 'zoom_in':
+        filters.append(
+            f"[0:v]zoompan=z='1+0.1*on/{total_frames}'"
+            f":x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)'"
+            f":d={total_frames}:s={canvas_size[0]}x{canvas_size[1]}:fps={fps}[{video_label}]"
         )
-        if isinstance(background_color, tuple):
-            background_clip = ColorClip(
-                size=(settings['width'], settings['height']),
-                color=background_color
-            ).with_duration(duration)
-            sub_clips = [background_clip, img]
-        else:
-            sub_clips = [img]
-        subtitles = s.get('subtitles', [])
-        default_style = styles.get('caption_white') or next(iter(styles.values()))
+    else:
+        filters.append(f"[0:v]loop=loop={total_frames - 1}:size=1:start=0[{video_label}]")
+
+    subtitles = scene.get('subtitles', [])
+    default_style = styles.get('caption_white') or next(iter(styles.values()))
 
-        # 字幕の処理ループ（2個目以降は出力対象外）
-        for j, sub in enumerate(subtitles[:1]):
-            style = styles.get(sub['style'], default_style)
+    # 字幕の処理ループ（2個目以降は出力対象外）
+    for j, sub in enumerate(subtitles[:1]):
+        style = styles.get(sub['style'], default_style)
 
-            # ---【修正箇所】表示時間の自動計算ロジック ---
-            start_time = sub['start_offset']
+        # ---【修正箇所】表示時間の自動計算ロジック ---
+        start_time = sub['start_offset']
 
-            if 'duration' in sub:
-                # JSONで明示的に指定されている場合はそれを使う
-                sub_duration = sub['duration']
+        if 'duration' in sub:
+            # JSONで明示的に指定されている場合はそれを使う
+            sub_duration = sub['duration']
+        else:
+            # 次の字幕があるか確認
+            if j < len(subtitles) - 1:
+                # 次の字幕の開始時間を取得
+                next_start = subtitles[j + 1]['start_offset']
+                # 次の字幕が始まるまでを表示時間とする
+                sub_duration = next_start - start_time
             else:
-                # 次の字幕があるか確認
-                if j < len(subtitles) - 1:
-                    # 次の字幕の開始時間を取得
-                    next_start = subtitles[j + 1]['start_offset']
-                    # 次の字幕が始まるまでを表示時間とする
-                    sub_duration = next_start - start_time
-                else:
-                    # 最後の字幕なら、シーン終了まで表示
-                    sub_duration = duration - start_time
-
-            # マイナスの時間にならないよう安全策
-            if sub_duration < 0:
-                sub_duration = 0.1
-            # ---------------------------------------------
-
-            target_width = int(settings['width'] * 0.9)
-
-            # 短い行を結合
-            merged_text = merge_short_lines(sub['text'], threshold=10)
-
-            # フォントサイズの自動計算
-            optimized_size = calculate_optimized_fontsize(
-                merged_text,
-                style['fontsize'],
-                target_width
-            )
+                # 最後の字幕なら、シーン終了まで表示
+                sub_duration = duration - start_time
+
+        # マイナスの時間にならないよう安全策
+        if sub_duration < 0:
+            sub_duration = 0.1
+        # ---------------------------------------------
+
+        # 短い行を結合
+        merged_text = merge_short_lines(sub['text'], threshold=10)
+
+        # フォントサイズの自動計算
+        optimized_size = calculate_optimized_fontsize(
+            merged_text,
+            style['fontsize'],
+            target_width,
+            font_path=style['font']
+        )
 
-            # 見切れ対策の改行+空白
-            display_text = merged_text + "\n "
-
-            position = tuple(sub['position'])
-            base_stroke_width = style.get('stroke_width', 0)
-
-            outer_stroke_enabled = style.get('outer_stroke_enabled', False)
-            outer_stroke_color = style.get('outer_stroke_color', 'black')
-            outer_stroke_extra_width = style.get('outer_stroke_extra_width', 1)
-
-            if outer_stroke_enabled and outer_stroke_extra_width > 0:
-                outer_clip = build_text_clip(
-                    text=display_text,
-                    style=style,
-                    font_size=optimized_size,
-                    width=target_width,
-                    start_time=start_time,
-                    duration=sub_duration,
-                    position=position,
-                    stroke_color=outer_stroke_color,
-                    stroke_width=base_stroke_width + outer_stroke_extra_width
-                )
-                sub_clips.append(outer_clip)
-
-            txt = build_text_clip(
-                text=display_text,
-                style=style,
-                font_size=optimized_size,
-                width=target_width,
-                start_time=start_time,
-                duration=sub_duration,
-                position=position
-            )
-            sub_clips.append(txt)
+        text_path = render_text_image(merged_text, style, optimized_size, target_width)
+        inputs.append(['-i', text_path])
 
-        scene_video = CompositeVideoClip(
-            sub_clips,
-            size=(settings['width'], settings['height']),
-            bg_color=background_color
+        x_expr, y_expr = overlay_position(tuple(sub['position']))
+        next_label = f"sub{j}"
+        filters.append(
+            f"[{video_label}][{len(inputs) - 1}:v]overlay=x={x_expr}:y={y_expr}"
+            f":enable='between(t,{start_time},{start_time + sub_duration})'[{next_label}]"
         )
-        scene_video = scene_video.with_audio(audio).with_duration(duration)
+        video_label = next_label
 
-        scene_clips.append(scene_video)
+    filters.append(f"[{video_label}]format=yuv420p,setsar=1[vout]")
 
-    if not scene_clips:
-        print("Error: 有効なシーンがありません。")
-        return
+    command = ['ffmpeg', '-y', '-hide_banner', '-loglevel', 'error']
+    for input_args in inputs:
+        command.extend(input_args)
+    command.extend(['-filter_complex', ';'.join(filters), '-map', '[vout]', '-map', '1:a'])
+    command.extend(segment_output_args(fps))
+    command.append(out_path)
 
-    final_video = concatenate_videoclips(scene_clips, method="compose")
+    succeeded = run_ffmpeg(command)
+    remove_work_files(work_files)
+    if not succeeded:
+        raise RuntimeError(f"シーン '{img_path}' のエンコードに失敗しました。")
+    return out_path
 
-    if thumbnail_path:
-        resolved_thumbnail_path = resolve_path(thumbnail_path, image_base_dir)
-        if os.path.exists(resolved_thumbnail_path):
-            thumbnail_duration = 0.5
-            thumbnail_image = ImageClip(resolved_thumbnail_path).with_duration(thumbnail_duration)
-            thumbnail_image = thumbnail_image.resized(width=settings['width']).with_position('center')
 
-            background_color = normalize_background_color(
-                settings.get('background_color', 'white')
-            )
-            if isinstance(background_color, tuple):
-                thumbnail_background = ColorClip(
-                    size=(settings['width'], settings['height']),
-                    color=background_color
-                ).with_duration(thumbnail_duration)
-                thumbnail_clip = CompositeVideoClip(
-                    [thumbnail_background, thumbnail_image],
-                    size=(settings['width'], settings['height']),
-                    bg_color=background_color
-                )
-            else:
-                thumbnail_clip = CompositeVideoClip(
-                    [thumbnail_image],
-                    size=(settings['width'], settings['height'])
-                )
+def render_thumbnail_segment(thumbnail_path, layout, out_path, thumbnail_duration=0.5):
+    """
+    末尾に挿入するサムネイルを無音のmp4セグメントとして書き出す関数
+    エンコードに失敗した場合はRuntimeErrorを送出する
+    """
+    fps = layout['fps']
+    frame_path = f"{os.path.splitext(out_path)[0]}_frame.png"
+    render_scene_frame(thumbnail_path, layout['background'], frame_path)
+
+    command = [
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-loop', '1', '-framerate', str(fps), '-t', str(thumbnail_duration), '-i', frame_path,
+        '-f', 'lavfi', '-t', str(thumbnail_duration), '-i', 'anullsrc=r=44100:cl=stereo',
+        '-vf', 'format=yuv420p,setsar=1',
+        '-map', '0:v', '-map', '1:a',
+    ]
+    command.extend(segment_output_args(fps))
+    command.append(out_path)
+
+    succeeded = run_ffmpeg(command)
+    remove_work_files([frame_path])
+    if not succeeded:
+        raise RuntimeError(f"サムネイル '{thumbnail_path}' のエンコードに失敗しました。")
+    return out_path
 
-            final_video = concatenate_videoclips([final_video, thumbnail_clip], method="compose")
-        else:
-            print(f"Warning: Thumbnail '{resolved_thumbnail_path}' not found. Skipping thumbnail insert.")
 
-    bgm_path = resolve_path(settings.get('bgm_path'), bgm_base_dir)
-    if bgm_path and os.path.exists(bgm_path):
-        bgm = AudioFileClip(bgm_path).with_volume_scaled(settings['bgm_volume'])
-        bgm = bgm.with_duration(final_video.duration)
+def create_video_from_json(json_path, image_base_dir=None, audio_base_dir=None, bgm_base_dir=None,
+                           output_base_dir=None, styles_path=None, thumbnail_path=None):
+    if not os.path.exists(json_path):
+        print(f"Error: JSON file '{json_path}' not found.")
+        return
+
+    data = load_json_file(json_path)
+
+    styles = load_styles(styles_path)
+    if not styles:
+        return
 
-        from moviepy.audio.AudioClip import CompositeAudioClip
-        combined_audio = CompositeAudioClip([final_video.audio, bgm])
-        final_video = final_video.with_audio(combined_audio)
+    settings = data['project_settings']
+    layout = build_layout(settings)
+    scenes = data['scenes']
 
     output_path = resolve_path(settings.get('output_file', 'output_shorts.mp4'), output_base_dir)
     output_dir = os.path.dirname(output_path)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    print(f"--- 書き出し開始: {output_path} ---")
-    final_video.write_videofile(
-        output_path,
-        fps=settings.get('fps', 30),
-        codec="libx264",
-        audio_codec="aac"
-    )
+    print(f"--- エンコーダ: {pick_h264_encoder()} ---")
+    # 存在確認用に、各ベースディレクトリのファイル名一覧を1回だけ取得しておく
+    dir_listings = {
+        base_dir: scan_dir_names(base_dir)
+        for base_dir in {image_base_dir, audio_base_dir, bgm_base_dir}
+        if base_dir
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print("--- シーンの生成開始 ---")
+        scene_paths = [os.path.join(work_dir, f"scene_{i:03}.mp4") for i in range(len(scenes))]
+
+        # エンコードはffmpegの子プロセスで行われるため、スレッドで並列に待ち合わせる
+        max_workers = max(1, min(len(scenes), os.cpu_count() or 1))
+        if pick_h264_encoder() != 'libx264':
+            max_workers = min(max_workers, HW_ENCODER_MAX_WORKERS)
+        print(f"{len(scenes)} シーンを最大 {max_workers} 並列で処理中...")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(
+                render_scene,
+                scenes,
+                repeat(layout),
+                repeat(styles),
+                repeat((image_base_dir, audio_base_dir)),
+                repeat(dir_listings),
+                scene_paths
+            )
+            try:
+                segment_paths = [path for path in results if path]
+            except RuntimeError as e:
+                # 1シーンでもエンコードに失敗したら、欠けた動画を書き出さずに中断する
+                executor.shutdown(cancel_futures=True)
+                print(f"Error: {e}")
+                return
+
+        if not segment_paths:
+            print("Error: 有効なシーンがありません。")
+            return
+
+        if thumbnail_path:
+            resolved_thumbnail_path = resolve_path(thumbnail_path, image_base_dir)
+            if file_exists(thumbnail_path, image_base_dir, dir_listings):
+                try:
+                    thumbnail_segment = render_thumbnail_segment(
+                        resolved_thumbnail_path,
+                        layout,
+                        os.path.join(work_dir, "thumbnail.mp4")
+                    )
+                except RuntimeError as e:
+                    print(f"Error: {e}")
+                    return
+                segment_paths.append(thumbnail_segment)
+            else:
+                print(f"Warning: Thumbnail '{resolved_thumbnail_path}' not found. Skipping thumbnail insert.")
+
+        bgm_path = resolve_path(settings.get('bgm_path'), bgm_base_dir)
+        use_bgm = file_exists(settings.get('bgm_path'), bgm_base_dir, dir_listings)
+
+        print(f"--- 書き出し開始: {output_path} ---")
+        if len(segment_paths) == 1:
+            # セグメントが1つだけなら結合処理そのものが不要
+            if not use_bgm:
+                shutil.move(segment_paths[0], output_path)
+                source_args = None
+            else:
+                source_args = ['-i', segment_paths[0]]
+        else:
+            concat_list_path = os.path.join(work_dir, "concat_list.txt")
+            with open(concat_list_path, 'w', encoding='utf-8') as f:
+                for path in segment_paths:
+                    f.write(f"file '{os.path.basename(path)}'\n")
+            source_args = ['-f', 'concat', '-safe', '0', '-i', concat_list_path]
+
+        if source_args is not None:
+            # 全セグメントが同じエンコード設定なので映像は再エンコードせずに結合し、
+            # BGMがある場合は同じパスの中で音声だけamixで合成する
+            command = ['ffmpeg', '-y', '-hide_banner', *source_args]
+            if use_bgm:
+                command.extend([
+                    '-i', bgm_path,
+                    '-filter_complex',
+                    f"[1:a]volume={settings['bgm_volume']}[bgm];"
+                    "[0:a][bgm]amix=inputs=2:duration=first:normalize=0[aout]",
+                    '-map', '0:v',
+                    '-map', '[aout]',
+                    '-c:v', 'copy',
+                    '-c:a', 'aac',
+                ])
+            else:
+                command.extend(['-c', 'copy'])
+            command.append(output_path)
+            if not run_ffmpeg(command):
+                return
     print("--- 完了 ---")
 
 
@@ -1,9 +1,117 @@
 import sys
 import os
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+import functools
+import multiprocessing
+import unicodedata
+from PIL import Image, ImageChops, ImageDraw, ImageFont, ImageFilter
 
 
-def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
+@functools.lru_cache(maxsize=8)
+def _load_font(path, size):
+    return ImageFont.truetype(path, size)
+
+
+def _clusters(text):
+    """
+    文字列を、結合文字（濁点など）を直前の文字にまとめた単位で返すジェネレータ
+    """
+    cluster = ''
+    for ch in text:
+        if cluster and unicodedata.category(ch) in ('Mn', 'Me'):
+            cluster += ch
+            continue
+        if cluster:
+            yield cluster
+        cluster = ch
+    if cluster:
+        yield cluster
+
+
+@functools.lru_cache(maxsize=1024)
+def _glyph_mask(font, glyph, stroke_width):
+    """
+    1文字分をラスタライズしたマスク(L)と、原点からのオフセットを返す関数
+    同じフォント・文字・縁取り幅の組み合わせは複数のサムネイルをまたいで再利用する
+    """
+    # 縁取りは FreeType のストローカーに任せる（輪郭を1回太らせるだけなので、
+    # マスクを MaxFilter で膨張させるより速く、角も丸いまま保てる）
+    left, top, right, bottom = font.getbbox(glyph, stroke_width=stroke_width)
+    mask = Image.new('L', (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), glyph, font=font, fill=255,
+                              stroke_width=stroke_width, stroke_fill=255)
+    return mask, (left, top)
+
+
+@functools.lru_cache(maxsize=1024)
+def _advance(font, glyph):
+    return font.getlength(glyph)
+
+
+@functools.lru_cache(maxsize=256)
+def _text_width(font, text):
+    """
+    文字の送り幅の合計（_text_mask の並べ方と同じ）でテキスト幅を返す関数
+    """
+    return sum(_advance(font, glyph) for glyph in _clusters(text))
+
+
+@functools.lru_cache(maxsize=256)
+def _text_mask(font, text, stroke_width):
+    """
+    キャッシュ済みの文字マスクを送り幅どおりに並べて、1行分のマスク(L)と
+    描画位置からのオフセットを返す関数
+    """
+    placed = []
+    cursor = 0.0
+    for glyph in _clusters(text):
+        mask, (offset_x, offset_y) = _glyph_mask(font, glyph, stroke_width)
+        if mask.width and mask.height:
+            placed.append((mask, round(cursor) + offset_x, offset_y))
+        cursor += _advance(font, glyph)
+
+    if not placed:
+        # 空白だけの行は何も描かない
+        return Image.new('L', (1, 1), 0), (0, 0)
+
+    left = min(x for _, x, _ in placed)
+    top = min(y for _, _, y in placed)
+    right = max(x + mask.width for mask, x, _ in placed)
+    bottom = max(y + mask.height for mask, _, y in placed)
+
+    line = Image.new('L', (right - left, bottom - top), 0)
+    for mask, x, y in placed:
+        # 太い縁取りは隣の文字と重なるので、上書きではなく明るい方を残して合成する
+        box = (x - left, y - top, x - left + mask.width, y - top + mask.height)
+        line.paste(ImageChops.lighter(line.crop(box), mask), box)
+    return line, (left, top)
+
+
+@functools.lru_cache(maxsize=64)
+def _text_plane(font, text, layers):
+    """
+    影・縁取り・本体色のレイヤーを1枚のRGBA画像に合成して返す関数
+    layers は (xずらし, yずらし, 色, 縁取り幅) を奥から順に並べたタプル
+    戻り値は合成画像と、描画位置からのオフセット
+    """
+    placed = []
+    for dx, dy, color, stroke_width in layers:
+        mask, (offset_x, offset_y) = _text_mask(font, text, stroke_width)
+        placed.append((mask, color, dx + offset_x, dy + offset_y))
+
+    left = min(x for _, _, x, _ in placed)
+    top = min(y for _, _, _, y in placed)
+    right = max(x + mask.width for mask, _, x, _ in placed)
+    bottom = max(y + mask.height for mask, _, _, y in placed)
+
+    plane = Image.new('RGBA', (right - left, bottom - top), (0, 0, 0, 0))
+    for mask, color, x, y in placed:
+        layer = Image.new('RGBA', mask.size, color)
+        layer.putalpha(mask)
+        plane.alpha_composite(layer, (x - left, y - top))
+    return plane, (left, top)
+
+
+def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path, canvas=None):
     """
     YouTube Shorts風のサムネイルを作成する関数
 
@@ -12,6 +120,10 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
         top_text (str): 上部に表示するテキスト
         bottom_text (str): 下部に表示するテキスト
         output_path (str): 出力するファイルパス
+        canvas (PIL.Image.Image): 使い回すキャンバス（省略時は新規作成）
+
+    Returns:
+        PIL.Image.Image: 描画に使ったキャンバス（失敗時は None）
     """
 
     # --- 設定項目 ---
@@ -48,9 +160,11 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
 
     # --- 処理開始 ---
 
-    # 1. キャンバスの作成
-    canvas = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), BG_COLOR)
-    draw = ImageDraw.Draw(canvas)
+    # 1. キャンバスの作成（渡された場合は背景色で塗り直して再利用）
+    if canvas is None:
+        canvas = Image.new('RGB', (CANVAS_WIDTH, CANVAS_HEIGHT), BG_COLOR)
+    else:
+        canvas.paste(BG_COLOR, (0, 0, CANVAS_WIDTH, CANVAS_HEIGHT))
 
     # 2. 画像の読み込みと配置
     try:
@@ -59,9 +173,19 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
         print(f"画像の読み込みに失敗しました: {e}")
         return
 
+    # JPEGの場合はデコード時に縮小させる（最終サイズの2倍以上は残してLANCZOSの品質を保つ）
+    img.draft('RGB', (CANVAS_WIDTH * 2, int(CANVAS_WIDTH * 2 * img.height / img.width)))
+
     # 画像をキャンバスの幅に合わせてリサイズ（アスペクト比維持）
     aspect_ratio = img.height / img.width
     new_height = int(CANVAS_WIDTH * aspect_ratio)
+
+    # まだ最終サイズの4倍以上ある場合は整数倍の縮小で画素数を減らしてからLANCZOSにかける
+    # （reduceが扱えないP・1・I;16などのモードは縮小せずにそのままresizeする）
+    reduce_factor = img.width // (CANVAS_WIDTH * 2)
+    if reduce_factor >= 2 and img.mode in ('L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK'):
+        img = img.reduce(reduce_factor)
+
     img_resized = img.resize((CANVAS_WIDTH, new_height), Image.Resampling.LANCZOS)
 
     # 画像をキャンバスの垂直中央に配置
@@ -69,37 +193,40 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
     canvas.paste(img_resized, (0, img_y))
 
     # 3. テキスト描画用のヘルパー関数
-    def draw_styled_text(draw_obj, text, y_pos, font, fill_color):
+    def draw_styled_text(text, y_pos, font, fill_color):
         if not text:
             return
 
-        # テキストのバウンディングボックスを取得して中央揃え位置を計算
-        # getbbox returns (left, top, right, bottom)
-        bbox = font.getbbox(text)
-        text_width = bbox[2] - bbox[0]
-        text_height = bbox[3] - bbox[1]
+        # 送り幅からテキスト幅を求めて中央揃え位置を計算（グリフの描画は不要）
+        text_width = _text_width(font, text)
 
-        x_pos = (CANVAS_WIDTH - text_width) // 2
+        x_pos = int((CANVAS_WIDTH - text_width) // 2)
 
         # 縁取りの太さ
         outer_stroke_width = 18
         stroke_width = 12
         outer_stroke_color = (0, 0, 0)
 
-        # 影の描画（少しずらして黒で描画）
+        # 影・本体色は縁取り無しの同じマスクを使い回す
+        # （外側の黒縁の上に描いていた本体色は、内側の白縁と本体色で上書きされるため省略）
         shadow_offset = 10
-        draw_obj.text((x_pos + shadow_offset, y_pos + shadow_offset), text, font=font, fill=SHADOW_COLOR)
+        layers = (
+            # 影の描画（少しずらして黒で描画）
+            (shadow_offset, shadow_offset, SHADOW_COLOR, 0),
+            # 外側の黒縁を描画
+            (0, 0, outer_stroke_color, outer_stroke_width),
+            # 内側の白縁＋本体色の描画
+            (0, 0, STROKE_COLOR, stroke_width),
+            (0, 0, fill_color, 0),
+        )
 
-        # 外側の黒縁を描画
-        draw_obj.text((x_pos, y_pos), text, font=font, fill=fill_color, stroke_width=outer_stroke_width,
-                      stroke_fill=outer_stroke_color)
-        # 内側の白縁＋本体色の描画
-        draw_obj.text((x_pos, y_pos), text, font=font, fill=fill_color, stroke_width=stroke_width,
-                      stroke_fill=STROKE_COLOR)
+        # 全レイヤーを合成済みの1枚として一度だけ貼り付ける
+        plane, (offset_x, offset_y) = _text_plane(font, text, layers)
+        canvas.paste(plane, (x_pos + offset_x, y_pos + offset_y), plane)
 
     # フォントのロード
     try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
+        font = _load_font(FONT_PATH, FONT_SIZE)
     except Exception as e:
         print(f"フォントのロードに失敗しました: {e}")
         return
@@ -112,7 +239,7 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
     for line in top_lines:
         # 上部は少し派手にするため、1行目をピンク、2行目を青にするなどのロジックも可能
         # ここではシンプルに指定色で描画
-        draw_styled_text(draw, line, current_y, font, TOP_TEXT_COLOR)
+        draw_styled_text(line, current_y, font, TOP_TEXT_COLOR)
         current_y += FONT_SIZE + 20  # 行間
 
     # 5. 下部テキストの描画
@@ -122,7 +249,7 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
     current_y = CANVAS_HEIGHT - total_bottom_height - 250  # 下部の余白
 
     for line in bottom_lines:
-        draw_styled_text(draw, line, current_y, font, BOTTOM_TEXT_COLOR)
+        draw_styled_text(line, current_y, font, BOTTOM_TEXT_COLOR)
         current_y += FONT_SIZE + 20
 
     # 6. 保存
@@ -131,12 +258,61 @@ def create_shorts_thumbnail(image_path, top_text, bottom_text, output_path):
         print(f"サムネイルを作成しました: {output_path}")
     except Exception as e:
         print(f"保存に失敗しました: {e}")
+        return
+
+    return canvas
+
+
+def create_shorts_thumbnails(jobs, processes=1):
+    """
+    複数のサムネイルを1プロセス内でまとめて作成する関数
+    フォント・文字マスク・キャンバスを使い回すため、1枚ずつ起動するより速い
+
+    Args:
+        jobs (list[tuple]): (画像パス, 上部テキスト, 下部テキスト, 出力ファイルパス) のリスト
+        processes (int): 並列に動かすプロセス数（1なら逐次処理）
+    """
+    jobs = list(jobs)
+    if processes > 1 and len(jobs) > 1:
+        # 各プロセスにジョブを振り分け、プロセス内ではキャンバスを使い回す
+        chunks = [jobs[i::processes] for i in range(min(processes, len(jobs)))]
+        with multiprocessing.Pool(len(chunks)) as pool:
+            pool.map(create_shorts_thumbnails, chunks)
+        return
+
+    canvas = None
+    for job in jobs:
+        canvas = create_shorts_thumbnail(*job, canvas=canvas) or canvas
+
+
+def load_batch_jobs(list_path):
+    """
+    タブ区切りのジョブ一覧（画像パス, 上部文字, 下部文字, 出力ファイル名）を読み込む関数
+    """
+    jobs = []
+    with open(list_path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            # 文字列に " を含めても崩れないよう、引用符は解釈せずタブだけで分割する
+            fields = line.split('\t')
+            if len(fields) < 4:
+                print(f"警告: {list_path} の {line_no} 行目は項目が足りないためスキップします: {line}")
+                continue
+            jobs.append(tuple(fields[:4]))
+    return jobs
 
 
 if __name__ == "__main__":
     # 引数チェック
-    if len(sys.argv) < 5:
+    if len(sys.argv) >= 3 and sys.argv[1] == '--batch':
+        # 一括作成: 1行に「画像パス<TAB>上部文字<TAB>下部文字<TAB>出力ファイル名」
+        workers = int(sys.argv[3]) if len(sys.argv) >= 4 else 1
+        create_shorts_thumbnails(load_batch_jobs(sys.argv[2]), workers)
+    elif len(sys.argv) < 5:
         print("使用法: python make_thumb.py [画像パス] [上部文字] [下部文字] [出力ファイル名]")
+        print("       python make_thumb.py --batch [ジョブ一覧.tsv] [並列数]")
         print("例: python make_thumb.py input.jpg \"ボーイッシュだった\" \"最高すぎた\" output.png")
     else:
         input_img = sys.argv[1]
@@ -7,12 +7,15 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 import re
 
 VOICEPEAK_EXE = r"C:\Program Files\VOICEPEAK\voicepeak"
+DEFAULT_JOBS = max(1, (os.cpu_count() or 2) // 2)
 
 SPEAKER_MAP = {
     "男性ナレーター": "Japanese Male 1",
@@ -25,7 +28,8 @@ TEXT_FLAG = "-t"
 OUTPUT_FLAG = "-o"
 EMOTION_FLAG = "-"
 
-LINE_PATTERN = re.compile(r"^\[(?P<person>[^/\]]+)\s*/\s*(?P<emotion>[^\]]+)\]\s*(?P<text>.+)$")
+LINE_BREAK_TABLE = str.maketrans({"\r": " ", "\n": " "})
+REPEATED_SPACES = re.compile(r" {2,}")
 
 
 @dataclass(frozen=True)
@@ -36,26 +40,34 @@ class ScriptLine:
 
 
 def sanitize_text(text: str) -> str:
-    text = text.replace("\\n", " ")
-    text = text.replace("\r", " ").replace("\n", " ")
-    return re.sub(r" {2,}", " ", text).strip()
+    text = text.replace("\\n", " ").translate(LINE_BREAK_TABLE)
+    return REPEATED_SPACES.sub(" ", text).strip()
+
+
+def split_script_line(line: str) -> tuple[str, str, str] | None:
+    """Split a stripped "[person / emotion] text" line; return None when it does not match."""
+    close = line.find("]", 1)
+    slash = line.find("/", 1, close)
+    if not line.startswith("[") or slash <= 1 or close <= slash + 1 or close == len(line) - 1:
+        return None
+    return line[1:slash], line[slash + 1 : close], line[close + 1 :]
 
 
 def parse_script(script_path: Path) -> list[ScriptLine]:
     lines: list[ScriptLine] = []
-    for index, raw_line in enumerate(script_path.read_text(encoding="utf-8").splitlines(), start=1):
-        stripped = raw_line.strip()
-        if not stripped:
-            continue
-        match = LINE_PATTERN.match(stripped)
-        if not match:
-            raise ValueError(f"Line {index} is not in the expected format: {raw_line}")
-        person = match.group("person").strip()
-        emotion = match.group("emotion").strip()
-        text = match.group("text").strip()
-        if person not in SPEAKER_MAP:
-            raise ValueError(f"Line {index} has an unknown person: {person}")
-        lines.append(ScriptLine(speaker=SPEAKER_MAP[person], emotion=emotion, text=text))
+    with script_path.open(encoding="utf-8") as script_file:
+        for index, raw_line in enumerate(script_file, start=1):
+            stripped = raw_line.strip()
+            if not stripped:
+                continue
+            parts = split_script_line(stripped)
+            if parts is None:
+                line_text = raw_line.rstrip("\n")
+                raise ValueError(f"Line {index} is not in the expected format: {line_text}")
+            person, emotion, text = (part.strip() for part in parts)
+            if person not in SPEAKER_MAP:
+                raise ValueError(f"Line {index} has an unknown person: {person}")
+            lines.append(ScriptLine(speaker=SPEAKER_MAP[person], emotion=emotion, text=text))
     return lines
 
 
@@ -65,32 +77,71 @@ def build_command(script_line: ScriptLine, output_path: Path, text_path: Path) -
         NARRATOR_FLAG,
         script_line.speaker,
         OUTPUT_FLAG,
-        str(output_path),
+        os.fspath(output_path),
         TEXT_FLAG,
-        str(text_path),
+        os.fspath(text_path),
     ]
     if script_line.emotion.lower() != "none":
         command.extend([EMOTION_FLAG, script_line.emotion])
     return command
 
 
-def run(script_path: Path, output_dir: Path) -> None:
+def is_up_to_date(output_path: Path, text_path: Path, command_path: Path, text: str, command: list[str]) -> bool:
+    return (
+        output_path.exists()
+        and text_path.exists()
+        and command_path.exists()
+        and text_path.read_text(encoding="utf-8") == text
+        and command_path.read_text(encoding="utf-8") == " ".join(command)
+    )
+
+
+def synthesize_line(command: list[str], text: str, text_path: Path, command_path: Path) -> None:
+    # Written here rather than up front so sidecar writes overlap across workers.
+    text_path.write_text(text, encoding="utf-8")
+    subprocess.run(command, check=True)
+    command_path.write_text(" ".join(command), encoding="utf-8")
+
+
+def run(script_path: Path, output_dir: Path, jobs: int = DEFAULT_JOBS) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     script_lines = parse_script(script_path)
+    commands: list[list[str]] = []
+    texts: list[str] = []
+    text_paths: list[Path] = []
+    command_paths: list[Path] = []
     for index, script_line in enumerate(script_lines, start=0):
         output_path = output_dir / f"{index:03}.wav"
         text_path = output_dir / f"{index:03}.txt"
-        text_path.write_text(sanitize_text(script_line.text), encoding="utf-8")
+        command_path = output_dir / f"{index:03}.cmd"
+        text = sanitize_text(script_line.text)
         command = build_command(script_line, output_path, text_path)
-        subprocess.run(command, check=True)
+        # Skip lines whose wav was already generated from the same text and command.
+        if is_up_to_date(output_path, text_path, command_path, text, command):
+            continue
+        # Drop the stale signature first so a failed run is never mistaken for an up-to-date one.
+        command_path.unlink(missing_ok=True)
+        commands.append(command)
+        texts.append(text)
+        text_paths.append(text_path)
+        command_paths.append(command_path)
+    # Each Voicepeak call is a separate process, so threads are enough to run them concurrently.
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        list(executor.map(synthesize_line, commands, texts, text_paths, command_paths))
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Generate Voicepeak audio files from a script file.")
     parser.add_argument("script_file", type=Path, help="Path to the script file.")
     parser.add_argument("output_dir", type=Path, help="Directory to write wav files.")
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of Voicepeak processes to run at once (defaults to {DEFAULT_JOBS}).",
+    )
     args = parser.parse_args()
-    run(args.script_file, args.output_dir)
+    run(args.script_file, args.output_dir, args.jobs)
 
 
 if __name__ == "__main__":
@@ -7,23 +7,50 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import os
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from itertools import repeat
 from pathlib import Path
 import re
 import tempfile
 import wave
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import soxr
+except ImportError:
+    soxr = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
 FIXED_SPEAKER = "Japanese Female 1"
 DEFAULT_VOICEPEAK_EXE = r"C:\Program Files\VOICEPEAK\voicepeak.exe"
+DEFAULT_JOBS = max(1, (os.cpu_count() or 2) // 2)
 
 NARRATOR_FLAG = "-n"
 TEXT_FLAG = "-t"
 OUTPUT_FLAG = "-o"
 EMOTION_FLAG = "-"
+NARRATOR_ARGS = (NARRATOR_FLAG, FIXED_SPEAKER)
+
+LINE_BREAK_TABLE = str.maketrans({"\r": " ", "\n": " "})
+REPEATED_SPACES = re.compile(r" {2,}")
+
 
-LINE_PATTERN = re.compile(r"^\[(?P<emotion>[^\]]+)\]\s*(?P<text>.+)$")
+WAV_CHUNK_FRAMES = 65536
+# 8-bit wav is unsigned; 24-bit has no numpy dtype and goes through ffmpeg.
+PCM_DTYPES = {1: "u1", 2: "<i2", 4: "<i4"}
 
 
 @dataclass(frozen=True)
@@ -33,77 +60,83 @@ class ScriptLine:
 
 
 def sanitize_text(text: str) -> str:
-    text = text.replace("\\n", " ")
-    text = text.replace("\r", " ").replace("\n", " ")
-    return re.sub(r" {2,}", " ", text).strip()
+    text = text.replace("\\n", " ").translate(LINE_BREAK_TABLE)
+    return REPEATED_SPACES.sub(" ", text).strip()
+
+
+def split_script_line(line: str) -> tuple[str, str] | None:
+    """Split a stripped "[emotion] text" line; return None when it does not match."""
+    close = line.find("]", 1)
+    if not line.startswith("[") or close <= 1 or close == len(line) - 1:
+        return None
+    return line[1:close], line[close + 1 :]
 
 
 def parse_script(script_path: Path) -> list[ScriptLine]:
     lines: list[ScriptLine] = []
-    for index, raw_line in enumerate(script_path.read_text(encoding="utf-8").splitlines(), start=1):
-        stripped = raw_line.strip()
-        if not stripped:
-            continue
-        match = LINE_PATTERN.match(stripped)
-        if not match:
-            raise ValueError(f"Line {index} is not in the expected format: {raw_line}")
-        emotion = match.group("emotion").strip()
-        text = match.group("text").strip()
-        lines.append(ScriptLine(emotion=emotion, text=text))
+    with script_path.open(encoding="utf-8") as script_file:
+        for index, raw_line in enumerate(script_file, start=1):
+            stripped = raw_line.strip()
+            if not stripped:
+                continue
+            parts = split_script_line(stripped)
+            if parts is None:
+                line_text = raw_line.rstrip("\n")
+                raise ValueError(f"Line {index} is not in the expected format: {line_text}")
+            emotion, text = (part.strip() for part in parts)
+            lines.append(ScriptLine(emotion=emotion, text=text))
     return lines
 
 
 def build_command(script_line: ScriptLine, output_path: Path, text_path: Path, voicepeak_exe: str) -> list[str]:
     command = [
         voicepeak_exe,
-        NARRATOR_FLAG,
-        FIXED_SPEAKER,
+        *NARRATOR_ARGS,
         OUTPUT_FLAG,
-        str(output_path),
+        os.fspath(output_path),
         TEXT_FLAG,
-        str(text_path),
+        os.fspath(text_path),
     ]
     if script_line.emotion.lower() != "none":
         command.extend([EMOTION_FLAG, script_line.emotion])
     return command
 
 
-def _sample_format_for_width(sampwidth: int) -> str:
-    formats = {1: "u8", 2: "s16", 3: "s24", 4: "s32"}
+def _raw_format_for_width(sampwidth: int) -> str:
+    formats = {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}
     if sampwidth not in formats:
         raise ValueError(f"Unsupported sample width: {sampwidth} bytes")
     return formats[sampwidth]
 
 
-def _convert_wav_to_match(
-    wav_path: Path,
-    target_params: wave._wave_params,
-    temp_dir: Path,
-) -> Path:
+def _convert_wav_to_match(wav_path: Path, target_params: wave._wave_params) -> bytes:
+    """Convert with ffmpeg and return raw PCM frames read from its stdout."""
     target_channels = target_params.nchannels
     target_width = target_params.sampwidth
     target_rate = target_params.framerate
-    sample_fmt = _sample_format_for_width(target_width)
-    output_path = temp_dir / f"{wav_path.stem}_converted.wav"
+    raw_format = _raw_format_for_width(target_width)
     command = [
         "ffmpeg",
-        "-y",
+        "-nostdin",
+        "-hide_banner",
+        "-loglevel",
+        "error",
         "-i",
         str(wav_path),
         "-ac",
         str(target_channels),
         "-ar",
         str(target_rate),
-        "-sample_fmt",
-        sample_fmt,
-        str(output_path),
+        "-f",
+        raw_format,
+        "-",
     ]
     example = (
-        f"ffmpeg -y -i {wav_path} -ac {target_channels} -ar {target_rate} "
-        f"-sample_fmt {sample_fmt} {output_path}"
+        f"ffmpeg -nostdin -hide_banner -loglevel error -i {wav_path} "
+        f"-ac {target_channels} -ar {target_rate} -f {raw_format} -"
     )
     try:
-        subprocess.run(command, check=True, capture_output=True, text=True)
+        result = subprocess.run(command, check=True, capture_output=True)
     except FileNotFoundError as exc:
         raise RuntimeError(
             "ffmpeg was not found while attempting to convert wav files.\n"
@@ -111,76 +144,222 @@ def _convert_wav_to_match(
             f"Example: {example}"
         ) from exc
     except subprocess.CalledProcessError as exc:
-        error_message = exc.stderr.strip() or exc.stdout.strip()
+        error_message = exc.stderr.decode(errors="replace").strip()
         raise RuntimeError(
             "Failed to convert wav file with ffmpeg.\n"
             f"Command: {' '.join(command)}\n"
             f"Example: {example}\n"
             f"Error output:\n{error_message}"
         ) from exc
-    return output_path
+    return result.stdout
+
+
+def _rewrap_samples(buf: bytes, src_width: int, dst_width: int) -> bytes:
+    """Change PCM sample width with integer shifts (8-bit wav is unsigned, wider widths are signed)."""
+    if src_width == dst_width:
+        return buf
+    samples = np.frombuffer(buf, dtype=PCM_DTYPES[src_width]).astype(np.int32)
+    if src_width == 1:
+        samples -= 128
+    shift = 8 * (dst_width - src_width)
+    samples = samples << shift if shift > 0 else samples >> -shift
+    if dst_width == 1:
+        samples += 128
+    return samples.astype(PCM_DTYPES[dst_width]).tobytes()
+
+
+def _mixdown(samples: np.ndarray, mixed: np.ndarray) -> None:
+    """Average each frame's channels into mixed[:, 0] in a single pass over the samples."""
+    channels = samples.shape[1]
+    for frame in prange(samples.shape[0]):
+        total = 0
+        for channel in range(channels):
+            total += samples[frame, channel]
+        mixed[frame, 0] = round(total / channels)
+
+
+if njit is not None and np is not None:
+    _mixdown = njit(parallel=True, cache=True)(_mixdown)
+
+
+def _match_channels(samples: np.ndarray, target_channels: int) -> np.ndarray:
+    source_channels = samples.shape[1]
+    if source_channels == target_channels:
+        return samples
+    if target_channels == 1:
+        if njit is None:
+            return samples.mean(axis=1, keepdims=True).round().astype(samples.dtype)
+        mixed = np.empty((samples.shape[0], 1), dtype=samples.dtype)
+        _mixdown(samples, mixed)
+        return mixed
+    return np.repeat(samples, target_channels, axis=1)
+
+
+def _convert_wav_in_process(wav_file: wave.Wave_read, target_params: wave._wave_params) -> bytes | None:
+    """Convert 8/16/32-bit PCM in memory; return None when ffmpeg is needed instead."""
+    source_params = wav_file.getparams()
+    if np is None or source_params.sampwidth not in PCM_DTYPES or target_params.sampwidth not in PCM_DTYPES:
+        return None
+    if source_params.nchannels != target_params.nchannels and 1 not in (
+        source_params.nchannels,
+        target_params.nchannels,
+    ):
+        return None
+    if source_params.framerate != target_params.framerate and (soxr is None or target_params.sampwidth == 1):
+        return None
+    frames = _rewrap_samples(
+        wav_file.readframes(source_params.nframes),
+        source_params.sampwidth,
+        target_params.sampwidth,
+    )
+    dtype = PCM_DTYPES[target_params.sampwidth]
+    samples = np.frombuffer(frames, dtype=dtype)
+    samples = _match_channels(samples.reshape(-1, source_params.nchannels), target_params.nchannels)
+    if source_params.framerate != target_params.framerate:
+        samples = soxr.resample(samples, source_params.framerate, target_params.framerate)
+    return np.ascontiguousarray(samples, dtype=dtype).tobytes()
+
+
+def _copy_frames(source: wave.Wave_read, output_wav: wave.Wave_write) -> None:
+    # Copy in fixed-size chunks so memory does not grow with the total audio length.
+    while chunk := source.readframes(WAV_CHUNK_FRAMES):
+        output_wav.writeframes(chunk)
+
+
+def _same_format(params: wave._wave_params, target_params: wave._wave_params) -> bool:
+    # nframes differs for every line, so only channels, width, rate and compression must match.
+    return params[:3] == target_params[:3] and params.comptype == target_params.comptype
 
 
 def concat_wav_files(wav_paths: list[Path], merged_output: Path) -> None:
     if not wav_paths:
         raise ValueError("No wav files were generated to concatenate.")
-    with wave.open(str(wav_paths[0]), "rb") as first_wav:
-        params = first_wav.getparams()
-    with tempfile.TemporaryDirectory() as temp_dir_name:
-        temp_dir = Path(temp_dir_name)
-        prepared_paths: list[Path] = [wav_paths[0]]
-        for wav_path in wav_paths[1:]:
-            with wave.open(str(wav_path), "rb") as wav_file:
-                if wav_file.getparams()[:4] == params[:4]:
-                    prepared_paths.append(wav_path)
-                    continue
-            prepared_paths.append(_convert_wav_to_match(wav_path, params, temp_dir))
-        frames: list[bytes] = []
-        for wav_path in prepared_paths:
-            with wave.open(str(wav_path), "rb") as wav_file:
-                frames.append(wav_file.readframes(wav_file.getnframes()))
     merged_output.parent.mkdir(parents=True, exist_ok=True)
-    with wave.open(str(merged_output), "wb") as output_wav:
-        output_wav.setparams(params)
-        for frame in frames:
-            output_wav.writeframes(frame)
+    # Write next to the target and move it into place only once every input has been merged.
+    fd, temp_name = tempfile.mkstemp(dir=merged_output.parent, prefix=f"{merged_output.stem}.", suffix=".tmp")
+    os.close(fd)
+    temp_output = Path(temp_name)
+    try:
+        with wave.open(str(wav_paths[0]), "rb") as first_wav, wave.open(str(temp_output), "wb") as output_wav:
+            params = first_wav.getparams()
+            output_wav.setparams(params)
+            _copy_frames(first_wav, output_wav)
+            for wav_path in wav_paths[1:]:
+                with wave.open(str(wav_path), "rb") as wav_file:
+                    if _same_format(wav_file.getparams(), params):
+                        _copy_frames(wav_file, output_wav)
+                        continue
+                    converted = _convert_wav_in_process(wav_file, params)
+                if converted is None:
+                    converted = _convert_wav_to_match(wav_path, params)
+                output_wav.writeframes(converted)
+        os.replace(temp_output, merged_output)
+    except BaseException:
+        temp_output.unlink(missing_ok=True)
+        raise
 
 
-def run(script_path: Path, output_dir: Path, voicepeak_exe: str, merged_output: Path) -> None:
+def is_up_to_date(output_path: Path, text_path: Path, command_path: Path, text: str, command: list[str]) -> bool:
+    return (
+        output_path.exists()
+        and text_path.exists()
+        and command_path.exists()
+        and text_path.read_text(encoding="utf-8") == text
+        and command_path.read_text(encoding="utf-8") == " ".join(command)
+    )
+
+
+def synthesize_line(
+    script_line: ScriptLine,
+    command: list[str],
+    text: str,
+    output_path: Path,
+    text_path: Path,
+    command_path: Path,
+    voicepeak_exe: str,
+) -> None:
+    # Written here rather than up front so sidecar writes overlap across workers.
+    text_path.write_text(text, encoding="utf-8")
+    try:
+        subprocess.run(command, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as exc:
+        if script_line.emotion.lower() != "none":
+            fallback_line = ScriptLine(emotion="none", text=script_line.text)
+            fallback_command = build_command(fallback_line, output_path, text_path, voicepeak_exe)
+            try:
+                subprocess.run(fallback_command, check=True, capture_output=True, text=True)
+                print(
+                    "Warning: Voicepeak failed with emotion "
+                    f"'{script_line.emotion}'. Retried without emotion.",
+                    file=sys.stderr,
+                )
+            except subprocess.CalledProcessError:
+                pass
+            else:
+                command_path.write_text(" ".join(command), encoding="utf-8")
+                return
+        stdout = exc.stdout or ""
+        stderr = exc.stderr or ""
+        raise RuntimeError(
+            "Voicepeak command failed.\n"
+            f"Command: {' '.join(command)}\n"
+            f"Stdout:\n{stdout}\n"
+            f"Stderr:\n{stderr}"
+        ) from exc
+    command_path.write_text(" ".join(command), encoding="utf-8")
+
+
+def run(
+    script_path: Path,
+    output_dir: Path,
+    voicepeak_exe: str,
+    merged_output: Path,
+    jobs: int = DEFAULT_JOBS,
+) -> None:
     output_dir.mkdir(parents=True, exist_ok=True)
     script_lines = parse_script(script_path)
+    pending_lines: list[ScriptLine] = []
+    commands: list[list[str]] = []
+    texts: list[str] = []
+    output_paths: list[Path] = []
+    text_paths: list[Path] = []
+    command_paths: list[Path] = []
     for index, script_line in enumerate(script_lines, start=1):
         output_path = output_dir / f"{index:03}.wav"
         text_path = output_dir / f"{index:03}.txt"
-        text_path.write_text(sanitize_text(script_line.text), encoding="utf-8")
+        command_path = output_dir / f"{index:03}.cmd"
+        text = sanitize_text(script_line.text)
         command = build_command(script_line, output_path, text_path, voicepeak_exe)
-        try:
-            subprocess.run(command, check=True, capture_output=True, text=True)
-        except subprocess.CalledProcessError as exc:
-            if script_line.emotion.lower() != "none":
-                fallback_line = ScriptLine(emotion="none", text=script_line.text)
-                fallback_command = build_command(fallback_line, output_path, text_path, voicepeak_exe)
-                try:
-                    subprocess.run(fallback_command, check=True, capture_output=True, text=True)
-                    print(
-                        "Warning: Voicepeak failed with emotion "
-                        f"'{script_line.emotion}'. Retried without emotion.",
-                        file=sys.stderr,
-                    )
-                    continue
-                except subprocess.CalledProcessError:
-                    pass
-            stdout = exc.stdout or ""
-            stderr = exc.stderr or ""
-            raise RuntimeError(
-                "Voicepeak command failed.\n"
-                f"Command: {' '.join(command)}\n"
-                f"Stdout:\n{stdout}\n"
-                f"Stderr:\n{stderr}"
-            ) from exc
+        # Skip lines whose wav was already generated from the same text and command.
+        if is_up_to_date(output_path, text_path, command_path, text, command):
+            continue
+        # Drop the stale signature first so a failed run is never mistaken for an up-to-date one.
+        command_path.unlink(missing_ok=True)
+        pending_lines.append(script_line)
+        commands.append(command)
+        texts.append(text)
+        output_paths.append(output_path)
+        text_paths.append(text_path)
+        command_paths.append(command_path)
+    # Each Voicepeak call is a separate process, so threads are enough to run them concurrently.
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        list(
+            executor.map(
+                synthesize_line,
+                pending_lines,
+                commands,
+                texts,
+                output_paths,
+                text_paths,
+                command_paths,
+                repeat(voicepeak_exe),
+            )
+        )
     wav_paths = sorted(output_dir.glob("*.wav"), key=lambda path: path.name)
-    if merged_output.resolve() in {path.resolve() for path in wav_paths}:
-        wav_paths = [path for path in wav_paths if path.resolve() != merged_output.resolve()]
+    # Only the merged file itself can collide, so compare names once the directories match.
+    merged_resolved = merged_output.resolve()
+    if merged_resolved.parent == output_dir.resolve():
+        wav_paths = [path for path in wav_paths if path.name != merged_resolved.name]
     concat_wav_files(wav_paths, merged_output)
 
 
@@ -194,9 +373,15 @@ def main() -> None:
         type=Path,
         help="Output path for the merged wav file (defaults to <output_dir>/merged.wav).",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_JOBS,
+        help=f"Number of Voicepeak processes to run at once (defaults to {DEFAULT_JOBS}).",
+    )
     args = parser.parse_args()
     merged_output = args.merged_output or (args.output_dir / "merged.wav")
-    run(args.script_file, args.output_dir, DEFAULT_VOICEPEAK_EXE, merged_output)
+    run(args.script_file, args.output_dir, DEFAULT_VOICEPEAK_EXE, merged_output, args.jobs)
 
 
 if __name__ == "__main__":